@@ -1,19 +1,29 @@
 import sys
 import time
 import math
+import threading
+import importlib.util
+from functools import partial
+from array import array
+from collections import deque
+from enum import IntEnum
 from ctypes import windll, c_int, c_char, c_float
 
 from PySide6.QtWidgets import (
 	QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
-	QLabel, QSlider, QMessageBox, QPushButton, QTextEdit
+	QLabel, QSlider, QPushButton, QPlainTextEdit
 )
-from PySide6.QtCore import Qt, Signal, QObject, QTimer
+from PySide6.QtCore import Qt, Signal, Slot, QObject, QTimer, QThread, QSize, QCoreApplication, QMetaObject
 from PySide6.QtGui import QPainter, QColor, QBrush, QFont, QTextCursor
 
-# 尝试导入用户定义的配置文件
-try:
-	import config
-except ImportError:
+# 尝试导入用户定义的配置文件 (延迟加载，首次访问属性时才执行)
+_config_spec = importlib.util.find_spec("config")
+if _config_spec is not None:
+	_config_spec.loader = importlib.util.LazyLoader(_config_spec.loader)
+	config = importlib.util.module_from_spec(_config_spec)
+	sys.modules["config"] = config
+	_config_spec.loader.exec_module(config)
+else:
 	# 创建一个虚拟的 config 模块作为后备
 	class DummyConfig:
 		ENERGY_IDLE = 5.0
@@ -34,81 +44,159 @@ except ImportError:
 # 0. Custom Stream for Logging
 #    - 将 stdout 重定向到 GUI 文本框
 # =============================================================================
-class Stream(QObject):
-	"""自定义流对象，用于将 print 输出重定向到 QTextEdit。"""
-	newText = Signal(str)
+class Stream:
+	"""自定义流对象，用于将 print 输出重定向到 QPlainTextEdit。
+
+	写入只追加到队列中，可从任意线程调用。有新内容待显示时调用一次 on_pending，
+	由 GUI 线程批量取出并显示，空闲时不会产生定时唤醒。
+	"""
+
+	def __init__(self, on_pending=None):
+		# deque 的 append/popleft 本身是线程安全的，写入时无需加锁
+		self.q = deque(maxlen=10_000)
+		self._on_pending = on_pending
+		self._armed = False
 
 	def write(self, text):
-		self.newText.emit(str(text))
+		text = str(text)
+		self.q.append(text)
+		# 先追加再检查: drain 在取出前清除标志，因此不会有片段滞留在队列中
+		if not self._armed and self._on_pending is not None:
+			self._armed = True
+			self._on_pending()
+		return len(text)
 
 	def flush(self):
 		pass # 在这个应用中是必需的，但可以留空
 
+	def drain(self) -> str:
+		"""取出当前缓存的全部片段并合并为一个字符串。"""
+		self._armed = False
+		q = self.q
+		chunks = []
+		while q:
+			chunks.append(q.popleft())
+		return "".join(chunks)
+
 
 # =============================================================================
 # 1. Hardware Controller Class
 #    - 管理与 USB3000.dll 的所有交互
 # =============================================================================
+class Chan(IntEnum):
+	"""模拟输出通道的引脚定义。"""
+	GRID = 1
+	FOCUS = 2
+	BEAM_BLANKING = 3
+	FILAMENT = 4
+	ENERGY = 5
+	DEFLECTION_X = 6
+	DEFLECTION_Y = 7
+	BEAM_ROCKING = 8
+	COMPUTER_CONTROL = 11
+
+
 class HardwareController:
 	"""处理 DLL 加载和向硬件发送命令。"""
 
+	# 每个通道对应一个固定的连续槽位，供按槽位索引的并行数组使用
+	CHANNELS = tuple(Chan)
+	SLOT = {ch: i for i, ch in enumerate(CHANNELS)}
+
 	def __init__(self):
 		self.dll = None
 		self.device_open = False
 		self.dummy_mode = False
 
-		# --- 引脚定义 ---
 		self.DevIndex = c_int(0)
-		self.GRID = c_char(1)
-		self.FOCUS = c_char(2)
-		self.BEAM_BLANKING = c_char(3)
-		self.FILAMENT = c_char(4)
-		self.ENERGY = c_char(5)
-		self.DEFLECTION_X = c_char(6)
-		self.DEFLECTION_Y = c_char(7)
-		self.BEAM_ROCKING = c_char(8)
-		self.COMPUTER_CONTROL = c_char(11)
+		# c_char 只在 DLL 调用边界使用，按通道编号索引
+		n = max(Chan) + 1
+		self._cchar = [c_char(i) for i in range(n)]
+		# 每个通道复用一个 c_float 缓冲区，避免每次写入都新建对象
+		self._volts = [c_float() for _ in range(n)]
+		# 每个通道最后一次写入的电压，用于跳过重复写入
+		self._last_v = {}
+		# ramp 线程与 GUI 线程都会写入，DLL 调用需串行
+		self._io_lock = threading.Lock()
 
 		try:
 			self.dll = windll.LoadLibrary(r'.\lib\x64\USB3000.dll')
 			print("成功加载 USB3000.dll")
+			# 声明函数原型，跳过 ctypes 每次调用时的参数类型推断
+			self.dll.USB3OpenDevice.argtypes = [c_int]
+			self.dll.USB3OpenDevice.restype = c_int
+			self.dll.USB3CloseDevice.argtypes = [c_int]
+			self.dll.USB3CloseDevice.restype = c_int
+			self.dll.SetUSB3AoImmediately.argtypes = [c_int, c_char, c_float]
+			self.dll.SetUSB3AoImmediately.restype = c_int
 		except OSError as e:
 			print(f"无法加载 USB3000.dll: {e}")
 			print("--- 将以虚拟模式运行 ---")
 			self.dummy_mode = True
 
 	def open_device(self) -> bool:
-		"""打开 USB 设备。如果打开失败则进入虚拟模式。"""
-		if self.dummy_mode:
+		"""打开 USB 设备。如果打开失败则进入虚拟模式，之后可再次调用以重试。"""
+		if self.dll is None:
+			# DLL 未加载，只能以虚拟模式运行
 			self.device_open = True
 			return True
-		if self.dll:
-			if self.dll.USB3OpenDevice(self.DevIndex) == 0:
-				print("USB3 设备已成功打开。")
-				self.device_open = True
-				return True
-			else:
-				print("错误: 无法打开 USB3 设备。")
-				self.device_open = False
-				self.dummy_mode = True
-				return False
-		return False
+		if self.dll.USB3OpenDevice(self.DevIndex) == 0:
+			print("USB3 设备已成功打开。")
+			self.device_open = True
+			self.dummy_mode = False
+			self._last_v.clear()  # 虚拟模式下记录的值并未真正写入硬件
+			return True
+		else:
+			print("错误: 无法打开 USB3 设备。")
+			self.device_open = False
+			self.dummy_mode = True
+			return False
 
 	def close_device(self):
 		"""关闭 USB 设备。"""
 		if self.device_open and not self.dummy_mode and self.dll:
-			self.dll.USB3CloseDevice(self.DevIndex)
+			with self._io_lock:
+				self.dll.USB3CloseDevice(self.DevIndex)
 			print("USB3 设备已关闭。")
 		self.device_open = False
+		self._last_v.clear()
 
-	def set_voltage(self, channel: c_char, voltage: float):
-		"""立即设置特定通道的电压。"""
+	def set_voltage(self, chan: int, voltage: float):
+		"""立即设置特定通道的电压。与上次写入值相差不足 0.1 mV 时跳过。"""
+		prev = self._last_v.get(chan)
+		if prev is not None and abs(prev - voltage) < 1e-4:
+			return
 		if self.dummy_mode:
-			print(f"dummy_mode: 设置通道 {ord(channel.value)} 为 {voltage:.2f} V")
+			self._last_v[chan] = voltage
+			print(f"dummy_mode: 设置通道 {int(chan)} 为 {voltage:.2f} V")
 			return
 		if self.device_open and self.dll:
-			self.dll.SetUSB3AoImmediately(self.DevIndex, channel, c_float(voltage))
-			#print(f"设置通道 {ord(channel.value)} 为 {voltage:.2f} V")
+			v = self._volts[chan]
+			v.value = voltage
+			with self._io_lock:
+				ret = self.dll.SetUSB3AoImmediately(self.DevIndex, self._cchar[chan], v)
+			# 只记录成功的写入，失败时下一次相同的值仍会重新发送
+			if ret == 0:
+				self._last_v[chan] = voltage
+			else:
+				self._last_v.pop(chan, None)
+			#print(f"设置通道 {int(chan)} 为 {voltage:.2f} V")
+
+
+class ShutdownWorker(QObject):
+	"""在后台线程中关闭 COMPUTER_CONTROL 并关闭设备，避免 USB 调用阻塞界面。"""
+	done = Signal()
+
+	def __init__(self, controller: HardwareController, chan: int):
+		super().__init__()
+		self.controller = controller
+		self._chan = chan
+
+	@Slot()
+	def run(self):
+		self.controller.set_voltage(self._chan, 0.0)
+		self.controller.close_device()
+		self.done.emit()
 
 
 # =============================================================================
@@ -116,70 +204,148 @@ class HardwareController:
 #    - 处理平滑的电压过渡逻辑
 # =============================================================================
 class RampingManager(QObject):
-	"""管理所有适用通道的电压ramp。"""
-
-	def __init__(self, controller: HardwareController, parent=None):
-		super().__init__(parent)
+	"""管理所有适用通道的电压ramp。
+
+	ramp 在独立的 QThread 中运行，界面绘制不会影响ramp节奏。公开的 set_* 方法可在
+	GUI 线程中调用，它们通过排队信号把更新交给工作线程，ramp 状态只由工作线程修改。
+	"""
+	_targetRequested = Signal(int, float, float)
+	_initialRequested = Signal(int, float, float)
+	# 视为已到达目标的容差。滑块以 1 mV 为步长，浮点下一步的差值可能略小于 1e-3，
+	# 因此取与 HardwareController.set_voltage 相同的 0.1 mV
+	_EPS = 1e-4
+
+	def __init__(self, controller: HardwareController):
+		super().__init__()
 		self.controller = controller
-		self._targets = {}
-		self._currents = {}
-		self._ramps = {}
+		# 以 HardwareController.SLOT 中的槽位索引的并行数组
+		n = len(controller.CHANNELS)
+		self._slots = controller.SLOT
+		self._chans = controller.CHANNELS
+		self._tgt = array('d', [0.0]) * n
+		self._cur = array('d', [0.0]) * n
+		self._ramp = array('d', [1.0]) * n
 
 		self._timer = QTimer(self)
+		self._timer.setTimerType(Qt.TimerType.PreciseTimer)
 		self._timer.setInterval(50)  # 每秒更新20次以实现平滑ramp
 		self._timer.timeout.connect(self._update_all_voltages)
-		self._last_update_time = 0
+		self._last_ns = 0
+
+		self._targetRequested.connect(self._apply_target, Qt.ConnectionType.QueuedConnection)
+		self._initialRequested.connect(self._apply_initial_state, Qt.ConnectionType.QueuedConnection)
+		self._thread = QThread()
+		# finished 在工作线程退出前于该线程内发出，直接连接以便在定时器所属线程中停止它
+		self._thread.finished.connect(self._timer.stop, Qt.ConnectionType.DirectConnection)
+		self.moveToThread(self._thread)
+		# 应用以其他方式退出时也要先停止工作线程；stop() 需在 GUI 线程中执行，因此直接连接
+		app = QCoreApplication.instance()
+		if app is not None:
+			app.aboutToQuit.connect(self.stop, Qt.ConnectionType.DirectConnection)
 
 	def start(self):
-		self._last_update_time = time.time()
-		self._timer.start()
+		"""启动ramp工作线程。"""
+		self._thread.start(QThread.Priority.HighPriority)
+
+	def stop(self):
+		"""停止ramp工作线程并等待其退出。"""
+		self._thread.quit()
+		self._thread.wait()
 
-	def set_initial_state(self, channel: c_char, voltage: float, ramp_rate: float):
+	def current(self, chan: int) -> float:
+		"""返回通道当前(已写入)的电压。"""
+		return self._cur[self._slots[chan]]
+
+	def set_initial_state(self, chan: int, voltage: float, ramp_rate: float):
 		"""在启动时立即设置通道的初始电压。"""
-		self._targets[channel.value] = voltage
-		self._currents[channel.value] = voltage
-		self._ramps[channel.value] = ramp_rate
-		self.controller.set_voltage(channel, voltage)
+		self._initialRequested.emit(chan, voltage, ramp_rate)
 
-	def set_target(self, channel: c_char, voltage: float, ramp_rate: float):
+	def set_target(self, chan: int, voltage: float, ramp_rate: float):
 		"""为通道设置一个新的目标电压以进行ramp。"""
-		if channel.value not in self._currents:
-			self._currents[channel.value] = 0.0
-		self._targets[channel.value] = voltage
-		self._ramps[channel.value] = ramp_rate
-
+		self._targetRequested.emit(chan, voltage, ramp_rate)
+
+	def _wake(self):
+		"""启动ramp定时器；所有通道到达目标后定时器会自行停止。"""
+		if not self._timer.isActive():
+			self._last_ns = time.perf_counter_ns()
+			self._timer.start()
+
+	@Slot(int, float, float)
+	def _apply_initial_state(self, chan: int, voltage: float, ramp_rate: float):
+		i = self._slots[chan]
+		self._tgt[i] = voltage
+		self._cur[i] = voltage
+		self._ramp[i] = ramp_rate
+		self.controller.set_voltage(chan, voltage)
+		self._wake()
+
+	@Slot(int, float, float)
+	def _apply_target(self, chan: int, voltage: float, ramp_rate: float):
+		i = self._slots[chan]
+		self._tgt[i] = voltage
+		self._ramp[i] = ramp_rate
+		self._wake()
+
+	@Slot()
 	def _update_all_voltages(self):
 		"""由 QTimer 调用以更新所有电压。"""
-		now = time.time()
-		delta_t = now - self._last_update_time
-		self._last_update_time = now
+		now = time.perf_counter_ns()
+		delta_t = (now - self._last_ns) * 1e-9
+		self._last_ns = now
 		if delta_t <= 0: return
 
-		for ch_val, target_v in self._targets.items():
-			current_v = self._currents.get(ch_val, 0.0)
-			if abs(current_v - target_v) < 0.001: continue
+		# 循环中用到的属性先绑定为局部变量
+		set_v = self.controller.set_voltage
+		tgt, cur, ramp = self._tgt, self._cur, self._ramp
+		any_active = False
+		for i, ch in enumerate(self._chans):
+			current_v = cur[i]
+			target_v = tgt[i]
+			delta = target_v - current_v
+			if abs(delta) < self._EPS: continue  # 只向仍在ramp的通道写入
 
-			ramp_rate = self._ramps.get(ch_val, 1.0)
-			max_change = ramp_rate * delta_t
+			max_change = ramp[i] * delta_t
+			new_v = current_v + min(max(delta, -max_change), max_change)
 
-			new_v = min(current_v + max_change, target_v) if target_v > current_v else max(current_v - max_change,
-																						   target_v)
+			cur[i] = new_v
+			set_v(ch, new_v)
+			if abs(target_v - new_v) >= self._EPS:
+				any_active = True
 
-			self._currents[ch_val] = new_v
-			self.controller.set_voltage(c_char(ch_val), new_v)
+		if not any_active:
+			self._timer.stop()  # 全部到达目标，等待下一次 set_target 再唤醒
 
 
 # =============================================================================
 # 3. Custom Widget Classes
 #    - 用于滑块和开关的 UI 组件
 # =============================================================================
+_LABEL_FONT = None
+
+
+def _label_font() -> QFont:
+	"""返回所有控件标签共用的字体。需在 QApplication 创建后调用，因此延迟构造。"""
+	global _LABEL_FONT
+	if _LABEL_FONT is None:
+		_LABEL_FONT = QFont("Arial", 10, QFont.Weight.Bold)
+	return _LABEL_FONT
+
+
 class ToggleSwitch(QWidget):
 	"""自定义拨动开关控件。"""
 	stateChanged = Signal(int)
 
+	# 绘制用的画刷在类级别创建一次，paintEvent 中直接复用
+	_BG_ON = QBrush(QColor("#4CAF50"))
+	_BG_OFF = QBrush(QColor("#BDBDBD"))
+	_HANDLE = QBrush(QColor("#FFFFFF"))
+	_NO_PEN = Qt.PenStyle.NoPen
+	_ANTIALIASING = QPainter.RenderHint.Antialiasing
+
 	def __init__(self, parent=None, width=60):
 		super().__init__(parent)
 		self.setFixedSize(width, 30)
+		self._handle_pos_on = width - 26
 		self._checked = False
 		self.setCursor(Qt.CursorShape.PointingHandCursor)
 
@@ -198,14 +364,12 @@ class ToggleSwitch(QWidget):
 
 	def paintEvent(self, event):
 		p = QPainter(self)
-		p.setRenderHint(QPainter.RenderHint.Antialiasing)
-		bg = QColor("#4CAF50") if self._checked else QColor("#BDBDBD")
-		handle_color = QColor("#FFFFFF")
-		p.setPen(Qt.PenStyle.NoPen)
-		p.setBrush(QBrush(bg))
+		p.setRenderHint(self._ANTIALIASING)
+		p.setPen(self._NO_PEN)
+		p.setBrush(self._BG_ON if self._checked else self._BG_OFF)
 		p.drawRoundedRect(self.rect(), 15, 15)
-		pos = self.width() - 26 if self._checked else 4
-		p.setBrush(QBrush(handle_color))
+		pos = self._handle_pos_on if self._checked else 4
+		p.setBrush(self._HANDLE)
 		p.drawEllipse(pos, 4, 22, 22)
 
 
@@ -219,7 +383,7 @@ class ToggleControl(QWidget):
 		layout.setContentsMargins(0, 5, 0, 5)
 		layout.setSpacing(5)
 		self.label = QLabel(name)
-		self.label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+		self.label.setFont(_label_font())
 		self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 		self.switch = ToggleSwitch()
 		self.switch.stateChanged.connect(self.stateChanged)
@@ -238,14 +402,18 @@ class VoltageSlider(QWidget):
 	def __init__(self, name: str, min_v: float, max_v: float, parent=None):
 		super().__init__(parent)
 		self.min_v, self.max_v = min_v, max_v
-		self.slider_min, self.slider_max = 0, 1000
+		# 滑块的整数值直接以毫伏为单位
+		self.slider_min, self.slider_max = round(min_v * 1000), round(max_v * 1000)
 		layout = QGridLayout(self)
 		layout.setContentsMargins(0, 5, 0, 5)
 		self.name_label = QLabel(name)
-		self.name_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+		self.name_label.setFont(_label_font())
 		self.slider = QSlider(Qt.Orientation.Horizontal)
 		self.slider.setRange(self.slider_min, self.slider_max)
+		self.slider.setSingleStep(10)
+		self.slider.setPageStep(100)
 		self.value_label = QLabel("0.00 V")
+		self._last_text = "0.00 V"
 		self.value_label.setMinimumWidth(60)
 		self.value_label.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
 		layout.addWidget(self.name_label, 0, 0)
@@ -253,21 +421,98 @@ class VoltageSlider(QWidget):
 		layout.addWidget(self.value_label, 1, 1)
 		self.slider.valueChanged.connect(self._on_slider_change)
 
-	def set_voltage(self, voltage: float):
-		"""通过代码设置滑块的电压值并更新UI。"""
+		# 拖动时每 30 ms 最多发出一次最新的电压值；松开滑块时立即发出
+		self._pending = None
+		self._flush_timer = QTimer(self)
+		self._flush_timer.setSingleShot(True)
+		self._flush_timer.setInterval(30)
+		self._flush_timer.timeout.connect(self._flush)
+		self.slider.sliderReleased.connect(self._on_slider_released)
+
+	def set_voltage(self, voltage: float, notify: bool = True):
+		"""通过代码设置滑块的电压值并更新UI。notify 为 False 时不发出 voltageChanged。"""
+		# 丢弃拖动中尚未发出的旧值，否则它会在之后覆盖这里设置的电压
+		self._flush_timer.stop()
+		self._pending = None
 		self.slider.blockSignals(True)
-		pos = self.slider_min + ((voltage - self.min_v) / (self.max_v - self.min_v)) * (
-				self.slider_max - self.slider_min)
-		self.slider.setValue(int(pos))
-		self.value_label.setText(f"{voltage:.2f} V")
+		self.slider.setValue(round(voltage * 1000))
+		self._set_label(voltage)
 		self.slider.blockSignals(False)
-		self.voltageChanged.emit(voltage)
+		if notify:
+			self.voltageChanged.emit(voltage)
 
+	def set_voltage_silent(self, voltage: float):
+		"""只更新滑块显示，不触发任何硬件写入。"""
+		self.set_voltage(voltage, notify=False)
+
+	@Slot(int)
 	def _on_slider_change(self, value: int):
 		"""当用户手动拖动滑块时调用。"""
-		voltage = self.min_v + (value / self.slider_max) * (self.max_v - self.min_v)
-		self.value_label.setText(f"{voltage:.2f} V")
-		self.voltageChanged.emit(voltage)
+		voltage = value * 0.001
+		self._set_label(voltage)
+		self._pending = voltage
+		# 定时器运行期间不重新计时，连续拖动时每个窗口发出一次，而不是等到停顿
+		if not self._flush_timer.isActive():
+			self._flush_timer.start()
+
+	def _set_label(self, voltage: float):
+		"""只有显示的文本变化时才更新标签，避免多余的重绘。"""
+		text = f"{voltage:.2f} V"
+		if text != self._last_text:
+			self.value_label.setText(text)
+			self._last_text = text
+
+	@Slot()
+	def _flush(self):
+		"""发出拖动过程中最新的电压值。"""
+		if self._pending is not None:
+			self.voltageChanged.emit(self._pending)
+			self._pending = None
+
+	@Slot()
+	def _on_slider_released(self):
+		"""松开滑块时立即发出最后的电压值，不等待定时器。"""
+		self._flush_timer.stop()
+		self._flush()
+
+
+class SliderPanel(QWidget):
+	"""两列排列的滑块面板。
+
+	在 resizeEvent 中直接计算每个滑块的位置，不经过嵌套布局的约束求解。
+	滑块按行优先顺序排列，数量为奇数时最后一个横跨两列。
+	"""
+	_MARGIN = 10
+	_SPACING = 20
+
+	def __init__(self, sliders, parent=None):
+		super().__init__(parent)
+		self._sliders = tuple(sliders)
+		self._rows = (len(self._sliders) + 1) // 2
+		for slider in self._sliders:
+			slider.setParent(self)
+
+	def sizeHint(self):
+		cell_w = max(s.sizeHint().width() for s in self._sliders)
+		cell_h = max(s.sizeHint().height() for s in self._sliders)
+		m, sp = self._MARGIN, self._SPACING
+		return QSize(2 * m + 2 * cell_w + sp, 2 * m + self._rows * cell_h + (self._rows - 1) * sp)
+
+	def minimumSizeHint(self):
+		return self.sizeHint()
+
+	def resizeEvent(self, event):
+		m, sp = self._MARGIN, self._SPACING
+		cell_w = (self.width() - 2 * m - sp) // 2
+		cell_h = (self.height() - 2 * m - (self._rows - 1) * sp) // self._rows
+		last = len(self._sliders) - 1
+		for i, slider in enumerate(self._sliders):
+			row, col = divmod(i, 2)
+			x = m + col * (cell_w + sp)
+			y = m + row * (cell_h + sp)
+			w = 2 * cell_w + sp if (i == last and col == 0) else cell_w
+			slider.setGeometry(x, y, w, cell_h)
+		super().resizeEvent(event)
 
 
 # =============================================================================
@@ -282,7 +527,12 @@ class MainWindow(QMainWindow):
 		self._is_shutting_down = False
 
 		self.controller = HardwareController()
-		self.ramping_manager = RampingManager(self.controller, self)
+		self.ramping_manager = RampingManager(self.controller)
+		# 通道编号缓存为普通 int，避免每次访问都经过 IntEnum
+		self._ch = {c.name: int(c) for c in Chan}
+		# ramp速率的倒数，估算回到 Idle 的时间时用乘法代替除法
+		self._inv_energy_ramp = 1.0 / config.ENERGY_RAMP
+		self._inv_filament_ramp = 1.0 / config.FILAMENT_RAMP
 
 		central_widget = QWidget()
 		self.setCentralWidget(central_widget)
@@ -307,8 +557,7 @@ class MainWindow(QMainWindow):
 		top_layout.addLayout(preset_button_layout, 0, 1, Qt.AlignmentFlag.AlignCenter)
 
 		self.beam_blank = ToggleControl("BEAM BLANKING")
-		self.beam_blank.stateChanged.connect(
-			lambda v: self.controller.set_voltage(self.controller.BEAM_BLANKING, float(v)))
+		self.beam_blank.stateChanged.connect(partial(self.controller.set_voltage, self._ch["BEAM_BLANKING"]))
 		top_layout.addWidget(self.beam_blank, 0, 2)
 
 		top_layout.setColumnStretch(0, 1)
@@ -316,11 +565,7 @@ class MainWindow(QMainWindow):
 		top_layout.setColumnStretch(2, 1)
 		main_layout.addLayout(top_layout)
 
-		# --- 创建滑块布局 ---
-		sliders_layout = QGridLayout()
-		sliders_layout.setSpacing(20)
-		sliders_layout.setContentsMargins(10, 10, 10, 10)
-
+		# --- 创建滑块面板 ---
 		self.energy_slider = VoltageSlider("ENERGY", 0.0, 10.0)
 		self.filament_slider = VoltageSlider("FILAMENT", 0.0, 10.0)
 		self.grid_slider = VoltageSlider("GRID", 0.0, 10.0)
@@ -329,112 +574,194 @@ class MainWindow(QMainWindow):
 		self.def_y_slider = VoltageSlider("DEFLECTION Y", -10.0, 10.0)
 		self.beam_rock_slider = VoltageSlider("BEAM ROCKING", -10.0, 10.0)
 
-		sliders_layout.addWidget(self.energy_slider, 0, 0)
-		sliders_layout.addWidget(self.filament_slider, 0, 1)
-		sliders_layout.addWidget(self.grid_slider, 1, 0)
-		sliders_layout.addWidget(self.focus_slider, 1, 1)
-		sliders_layout.addWidget(self.def_x_slider, 2, 0)
-		sliders_layout.addWidget(self.def_y_slider, 2, 1)
-		sliders_layout.addWidget(self.beam_rock_slider, 3, 0, 1, 2)
-		main_layout.addLayout(sliders_layout)
+		main_layout.addWidget(SliderPanel((
+			self.energy_slider, self.filament_slider,
+			self.grid_slider, self.focus_slider,
+			self.def_x_slider, self.def_y_slider,
+			self.beam_rock_slider,
+		)))
 		main_layout.addStretch()
 
 		# --- NEW: 创建输出面板 ---
-		self.output_panel = QTextEdit()
+		self.output_panel = QPlainTextEdit()
 		self.output_panel.setReadOnly(True)
 		self.output_panel.setFont(QFont("Courier", 9))
 		self.output_panel.setStyleSheet("background-color: #f0f0f0; border: 1px solid #ccc;")
 		self.output_panel.setFixedHeight(150)
+		self.output_panel.setMaximumBlockCount(2000)  # 限制日志行数
+		# 固定在文档末尾的光标，追加日志时直接复用，无需每次移动面板光标
+		self._end_cursor = QTextCursor(self.output_panel.document())
+		self._end_cursor.movePosition(QTextCursor.MoveOperation.End)
 		main_layout.addWidget(self.output_panel)
 
 		# --- 连接信号 ---
 		self.idle_button.clicked.connect(self.set_idle_state)
 		self.work_button.clicked.connect(self.set_work_state)
-		self.energy_slider.voltageChanged.connect(
-			lambda v: self.ramping_manager.set_target(self.controller.ENERGY, v, config.ENERGY_RAMP))
-		self.filament_slider.voltageChanged.connect(
-			lambda v: self.ramping_manager.set_target(self.controller.FILAMENT, v, config.FILAMENT_RAMP))
-		self.grid_slider.voltageChanged.connect(lambda v: self.controller.set_voltage(self.controller.GRID, v))
-		self.focus_slider.voltageChanged.connect(lambda v: self.controller.set_voltage(self.controller.FOCUS, v))
-		self.def_x_slider.voltageChanged.connect(lambda v: self.controller.set_voltage(self.controller.DEFLECTION_X, v))
-		self.def_y_slider.voltageChanged.connect(lambda v: self.controller.set_voltage(self.controller.DEFLECTION_Y, v))
-		self.beam_rock_slider.voltageChanged.connect(
-			lambda v: self.controller.set_voltage(self.controller.BEAM_ROCKING, v))
+		# 滑块 -> 通道 的对应表: ramp通道经由 RampingManager，其余通道直接写入
+		self._ramp_sliders = (
+			(self.energy_slider, self._ch["ENERGY"], config.ENERGY_RAMP),
+			(self.filament_slider, self._ch["FILAMENT"], config.FILAMENT_RAMP),
+		)
+		self._direct_sliders = (
+			(self.grid_slider, self._ch["GRID"]),
+			(self.focus_slider, self._ch["FOCUS"]),
+			(self.def_x_slider, self._ch["DEFLECTION_X"]),
+			(self.def_y_slider, self._ch["DEFLECTION_Y"]),
+			(self.beam_rock_slider, self._ch["BEAM_ROCKING"]),
+		)
+		for slider, ch, ramp_rate in self._ramp_sliders:
+			slider.voltageChanged.connect(partial(self.ramping_manager.set_target, ch, ramp_rate=ramp_rate))
+		for slider, ch in self._direct_sliders:
+			slider.voltageChanged.connect(partial(self.controller.set_voltage, ch))
+
+		# --- 状态栏: 设备未连接时显示提示和重试按钮 ---
+		self._retry_button = QPushButton("重试")
+		self._retry_button.clicked.connect(self._try_open)
+		self._retry_button.hide()
+		self.statusBar().addPermanentWidget(self._retry_button)
+		self._states_initialized = False
+
+		# --- 延迟执行的操作: 先ramp到 Idle，再切换 Computer Control 或关闭 ---
+		self._pending_cc_value = 0
+		self._deferred_cc = QTimer(self)
+		self._deferred_cc.setSingleShot(True)
+		self._deferred_cc.timeout.connect(self._apply_deferred_cc)
+		self._deferred_shutdown = QTimer(self)
+		self._deferred_shutdown.setSingleShot(True)
+		self._deferred_shutdown.timeout.connect(self._perform_final_shutdown)
+		self._shutdown_thread = None
 
 		# --- 初始化 ---
 		self.setup_logging()
-		self.open_device_and_show_status()
-		self.initialize_states()
 		self.ramping_manager.start()
+		# 进入事件循环后再打开设备，窗口不会被打开过程阻塞
+		QTimer.singleShot(0, self._try_open)
 
 	def setup_logging(self):
 		"""NEW: 重定向 stdout 到输出面板。"""
-		self._stream = Stream()
-		self._stream.newText.connect(self.on_new_text)
+		# 有新输出时启动一次性定时器，50 ms 后把累积的输出一次性追加到面板
+		self._log_timer = QTimer(self)
+		self._log_timer.setSingleShot(True)
+		self._log_timer.setInterval(50)
+		self._log_timer.timeout.connect(self._drain_log)
+		self._stream = Stream(self._arm_log_drain)
 		sys.stdout = self._stream
 		# 存储原始 stdout 以便在退出时恢复
 		self._original_stdout = sys.__stdout__
 
+	def _arm_log_drain(self):
+		"""可从任意线程调用: 排队到 GUI 线程启动取出定时器。"""
+		QMetaObject.invokeMethod(self._log_timer, "start", Qt.ConnectionType.QueuedConnection)
+
+	@Slot()
+	def _drain_log(self):
+		text = self._stream.drain()
+		if text:
+			self.on_new_text(text)
+
 	def on_new_text(self, text: str):
 		"""NEW: 将文本附加到输出面板。"""
-		self.output_panel.moveCursor(QTextCursor.MoveOperation.End)
-		self.output_panel.insertPlainText(text)
+		self._end_cursor.insertText(text)
+		scroll_bar = self.output_panel.verticalScrollBar()
+		scroll_bar.setValue(scroll_bar.maximum())
 
 	def initialize_states(self):
 		"""在启动时立即设置所有通道的初始值。"""
 		print("正在初始化通道状态...")
-		self.energy_slider.set_voltage(config.ENERGY_IDLE)
-		self.filament_slider.set_voltage(config.FILAMENT_IDLE)
-		self.grid_slider.set_voltage(config.GRID_CAL)
-		self.focus_slider.set_voltage(config.FOCUS_CAL)
-		self.def_x_slider.set_voltage(config.X_CAL)
-		self.def_y_slider.set_voltage(config.Y_CAL)
-		self.beam_rock_slider.set_voltage(config.BEAM_ROCK)
-
-		self.ramping_manager.set_initial_state(self.controller.ENERGY, config.ENERGY_IDLE, config.ENERGY_RAMP)
-		self.ramping_manager.set_initial_state(self.controller.FILAMENT, config.FILAMENT_IDLE, config.FILAMENT_RAMP)
+		# 滑块只更新显示，每个通道由下面的调用各写入一次
+		self.energy_slider.set_voltage_silent(config.ENERGY_IDLE)
+		self.filament_slider.set_voltage_silent(config.FILAMENT_IDLE)
+		self.grid_slider.set_voltage_silent(config.GRID_CAL)
+		self.focus_slider.set_voltage_silent(config.FOCUS_CAL)
+		self.def_x_slider.set_voltage_silent(config.X_CAL)
+		self.def_y_slider.set_voltage_silent(config.Y_CAL)
+		self.beam_rock_slider.set_voltage_silent(config.BEAM_ROCK)
+
+		self.controller.set_voltage(self._ch["GRID"], config.GRID_CAL)
+		self.controller.set_voltage(self._ch["FOCUS"], config.FOCUS_CAL)
+		self.controller.set_voltage(self._ch["DEFLECTION_X"], config.X_CAL)
+		self.controller.set_voltage(self._ch["DEFLECTION_Y"], config.Y_CAL)
+		self.controller.set_voltage(self._ch["BEAM_ROCKING"], config.BEAM_ROCK)
+		self.ramping_manager.set_initial_state(self._ch["ENERGY"], config.ENERGY_IDLE, config.ENERGY_RAMP)
+		self.ramping_manager.set_initial_state(self._ch["FILAMENT"], config.FILAMENT_IDLE, config.FILAMENT_RAMP)
 		print("初始化完成。")
 
+	@Slot()
 	def set_idle_state(self):
 		"""将 ENERGY 和 FILAMENT ramp到 IDLE 状态。"""
 		print("设置状态为: Idle")
 		self.energy_slider.set_voltage(config.ENERGY_IDLE)
 		self.filament_slider.set_voltage(config.FILAMENT_IDLE)
 
+	@Slot()
 	def set_work_state(self):
 		"""将 ENERGY 和 FILAMENT ramp到 WORK 状态。"""
 		print("设置状态为: Work")
 		self.energy_slider.set_voltage(config.ENERGY_WORK)
 		self.filament_slider.set_voltage(config.FILAMENT_WORK)
 
-	def open_device_and_show_status(self):
-		"""尝试打开设备并显示结果。"""
-		if not self.controller.open_device():
-			QMessageBox.warning(self, "未能打开设备",
-								"未能连接到采集卡\n请检查USB线是否插好\n以及驱动和dll库的设置是否正确")
+	@Slot()
+	def _try_open(self):
+		"""尝试打开设备，失败时在状态栏提示而不弹出模态对话框。"""
+		opened = self.controller.open_device()
+		if opened:
+			self.statusBar().clearMessage()
+			self._retry_button.hide()
+		else:
+			self.statusBar().showMessage("USB设备未连接 — 请检查USB线、驱动和dll库，然后点击重试", 0)
+			self._retry_button.show()
+
+		if opened and self._states_initialized:
+			# 重试成功: 虚拟模式下的操作从未到达硬件，按全新启动处理。
+			# 开关复位为关闭 (与硬件一致)，滑块由 initialize_states 恢复为配置值
+			print("设备已连接，恢复为初始状态。")
+			self._deferred_cc.stop()
+			for control in (self.beam_blank, self.comp_ctrl):
+				control.switch.blockSignals(True)
+				control.switch.setChecked(False)
+				control.switch.blockSignals(False)
+
+		# 首次尝试后总是初始化；重试成功时重新写入初始值到真实硬件
+		if opened or not self._states_initialized:
+			self.initialize_states()
+			self._states_initialized = True
+
+	def _ramp_snapshot(self) -> tuple[float, float, bool, int]:
+		"""读取 ENERGY/FILAMENT 当前电压，返回 (current_e, current_f, is_idle, 回到 Idle 所需的毫秒数)。"""
+		current_e = self.ramping_manager.current(self._ch["ENERGY"])
+		current_f = self.ramping_manager.current(self._ch["FILAMENT"])
+		is_idle = math.isclose(current_e, config.ENERGY_IDLE) and math.isclose(current_f, config.FILAMENT_IDLE)
+		if is_idle:
+			return current_e, current_f, True, 0
 
-	def safe_toggle_computer_control(self, voltage_value: float):
-		"""安全地切换 COMPUTER_CONTROL 的状态。"""
-		current_e = self.ramping_manager._currents.get(self.controller.ENERGY.value, 0.0)
-		current_f = self.ramping_manager._currents.get(self.controller.FILAMENT.value, 0.0)
+		time_e = abs(current_e - config.ENERGY_IDLE) * self._inv_energy_ramp
+		time_f = abs(current_f - config.FILAMENT_IDLE) * self._inv_filament_ramp
+		delay_ms = int(max(time_e, time_f) * 1000) + 100
+		return current_e, current_f, False, delay_ms
 
-		is_idle = math.isclose(current_e, config.ENERGY_IDLE) and math.isclose(current_f, config.FILAMENT_IDLE)
+	@Slot(int)
+	def safe_toggle_computer_control(self, voltage_value: int):
+		"""安全地切换 COMPUTER_CONTROL 的状态。"""
+		self._deferred_cc.stop()  # 取消上一次尚未执行的切换
+		_, _, is_idle, delay_ms = self._ramp_snapshot()
 
 		if is_idle:
 			print("系统已处于 Idle 状态，立即切换 Computer Control。")
-			self.controller.set_voltage(self.controller.COMPUTER_CONTROL, voltage_value)
+			self.controller.set_voltage(self._ch["COMPUTER_CONTROL"], voltage_value)
 		else:
 			print("警告: 系统不处于 Idle 状态。将首先ramp到 Idle...")
 			self.set_idle_state()
 
-			time_e = abs(current_e - config.ENERGY_IDLE) / config.ENERGY_RAMP
-			time_f = abs(current_f - config.FILAMENT_IDLE) / config.FILAMENT_RAMP
-			delay_ms = int(max(time_e, time_f) * 1000) + 100
-
 			print(f"预计ramp时间: {delay_ms / 1000:.1f} 秒。将在之后切换 Computer Control。")
-			QTimer.singleShot(delay_ms,
-							  lambda: self.controller.set_voltage(self.controller.COMPUTER_CONTROL, voltage_value))
+			self._pending_cc_value = voltage_value
+			self._deferred_cc.start(delay_ms)
 
+	@Slot()
+	def _apply_deferred_cc(self):
+		"""ramp到 Idle 后执行延迟的 Computer Control 切换。"""
+		self.controller.set_voltage(self._ch["COMPUTER_CONTROL"], self._pending_cc_value)
+
+	@Slot()
 	def _perform_final_shutdown(self):
 		"""执行最后的关闭步骤。"""
 		print("ramp完成。关闭 Computer Control 并退出。")
@@ -442,9 +769,19 @@ class MainWindow(QMainWindow):
 		self.comp_ctrl.switch.setChecked(False)
 		self.comp_ctrl.switch.blockSignals(False)
 
-		self.controller.set_voltage(self.controller.COMPUTER_CONTROL, 0.0)
-		self.controller.close_device()
-
+		self.ramping_manager.stop()
+		self._shutdown_thread = QThread()
+		self._shutdown_worker = ShutdownWorker(self.controller, self._ch["COMPUTER_CONTROL"])
+		self._shutdown_worker.moveToThread(self._shutdown_thread)
+		self._shutdown_thread.started.connect(self._shutdown_worker.run)
+		self._shutdown_worker.done.connect(self._on_shutdown_done, Qt.ConnectionType.QueuedConnection)
+		self._shutdown_thread.start()
+
+	@Slot()
+	def _on_shutdown_done(self):
+		"""硬件已关闭，结束后台线程并退出。"""
+		self._shutdown_thread.quit()
+		self._shutdown_thread.wait()
 		self._is_shutting_down = True
 		self.close()
 
@@ -458,30 +795,32 @@ class MainWindow(QMainWindow):
 			event.accept()
 			return
 
+		if self._shutdown_thread is not None and self._shutdown_thread.isRunning():
+			# 后台线程仍在关闭硬件，等待其完成后由 _on_shutdown_done 关闭窗口
+			event.ignore()
+			return
+
 		if not self.comp_ctrl.switch.isChecked():
 			print("Computer Control 已关闭。")
+			self.ramping_manager.stop()
 			self.controller.close_device()
 			event.accept()
 			return
 
-		print("关闭请求：Computer Control 处于开启状态。")
 		event.ignore()
+		if self._deferred_shutdown.isActive():
+			return  # 关闭流程已在进行中
+		print("关闭请求：Computer Control 处于开启状态。")
+		self._deferred_cc.stop()  # 关闭流程会将 Computer Control 置零，丢弃尚未执行的切换
 
-		current_e = self.ramping_manager._currents.get(self.controller.ENERGY.value, 0.0)
-		current_f = self.ramping_manager._currents.get(self.controller.FILAMENT.value, 0.0)
-		is_idle = math.isclose(current_e, config.ENERGY_IDLE) and math.isclose(current_f, config.FILAMENT_IDLE)
-
-		delay_ms = 0
+		_, _, is_idle, delay_ms = self._ramp_snapshot()
 		if not is_idle:
 			print("系统不处于 idle 状态，ramp到idle...")
 			self.set_idle_state()
-			time_e = abs(current_e - config.ENERGY_IDLE) / config.ENERGY_RAMP
-			time_f = abs(current_f - config.FILAMENT_IDLE) / config.FILAMENT_RAMP
-			delay_ms = int(max(time_e, time_f) * 1000) + 100
 		else:
 			print("系统已处于 Idle 状态。")
 
-		QTimer.singleShot(delay_ms, self._perform_final_shutdown)
+		self._deferred_shutdown.start(delay_ms)
 
 
 # =============================================================================
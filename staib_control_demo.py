@@ -29,6 +29,22 @@ COMPUTER_CONTROL = ctypes.c_char(11)
 #n.c.23
 #n.c.24
 
+# 声明函数原型，调用时跳过 ctypes 的参数类型推断
+dll.USB3OpenDevice.argtypes = [c_int]
+dll.USB3OpenDevice.restype = c_int
+dll.USB3CloseDevice.argtypes = [c_int]
+dll.USB3CloseDevice.restype = c_int
+dll.SetUSB3AoImmediately.argtypes = [c_int, c_char, c_float]
+dll.SetUSB3AoImmediately.restype = c_int
+
+# 写入电压时复用同一个 c_float，避免每次调用都新建对象
+_V = ctypes.c_float(0.0)
+
+def set_ao(chan, v):
+	#设置模拟输出对应通道对应电压值
+	_V.value = float(v)
+	return dll.SetUSB3AoImmediately(DevIndex, chan, _V)
+
 ############################################################################################################
 if __name__ == "__main__":
 	#打开采集卡
@@ -36,10 +52,7 @@ if __name__ == "__main__":
 	print(_)
 
 	# 设置对应通道电压值
-	GRID_v = ctypes.c_float(1)
-
-	#设置模拟输出对应通道对应电压值
-	temp = dll.SetUSB3AoImmediately(DevIndex,GRID,GRID_v)
+	temp = set_ao(GRID, 1)
 	print(temp)
 
 	#关闭采集卡